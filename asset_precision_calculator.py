@@ -1,27 +1,42 @@
-from cachetools import cached
-import numpy as np
 from binance_client import BinanceClient
 import logging
-from functools import lru_cache
+from threading import Lock
 
 
 class AssetPrecisionCalculator:
+
+    # Stablecoins are priced at ~1 USDT so always round to 2 DP. Seeded to avoid fetching their step size
+    STABLECOIN_PRECISIONS = {"USDT": 2, "BUSD": 2, "USDC": 2, "FDUSD": 2}
+
     def __init__(self, binance_client: BinanceClient):
         self.binance_client = binance_client
+        self.precisions = dict(self.STABLECOIN_PRECISIONS)
+        self.precisions_lock = Lock()
 
-    @lru_cache(maxsize=None)
     def get_asset_precision(self, asset: str):
+        """
+        Precision is calculated once per asset. Called from multiple threads, so the lock ensures concurrent
+        first lookups for the same asset only fetch its step size once.
+        """
+        precision = self.precisions.get(asset)
+        if precision is not None:
+            return precision
+        with self.precisions_lock:
+            if asset not in self.precisions:
+                self.precisions[asset] = self.__calculate_asset_precision(asset)
+            return self.precisions[asset]
+
+    def __calculate_asset_precision(self, asset: str):
         logging.info(f"Getting presicion for asset: {asset}")
         precision = 2
         try:
-            # Get price of asset in dollars
-            price = 1 if asset == "USDT" else self.binance_client.get_cached_symbol_price(asset + "USDT")
-            # Default precision against USDT is 2 DP. Add number of exponents to get realistic rounding precision (lowest precision of 0)
-            precision = max(2 + self.__get_exponents(price), 0)
+            # Step size against USDT is the smallest quantity Binance trades the asset in. Eg. "0.00010000" is 4 DP
+            step_size = self.binance_client.get_symbol_step_size(asset + "USDT")
+            precision = self.__get_decimal_places(step_size)
         except Exception:
             logging.exception(f"Error getting precision for asset {asset}. Defaulting to 2 DP.")
         logging.info(f"Calculated precision at {precision} DP for asset {asset}")
         return precision
 
-    def __get_exponents(self, price: float):
-        return int(np.floor(np.log10(np.abs(price))))
+    def __get_decimal_places(self, step_size: str):
+        return len(str(step_size).partition(".")[2].rstrip("0"))
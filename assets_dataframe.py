@@ -1,24 +1,31 @@
-import pandas as pd
+from typing import Dict, Iterable, Tuple
 
 
 class AssetsDataframe:
+    """
+    Holds the next safety order value for each active symbol, grouped by quote asset.
 
-    SYMBOL_COLUMN = "symbol"
-    NEXT_SO_COLUMN = "next_so"
-    QUOTE_ASSET_COLUMN = "quote_asset"
+    Only a handful of symbols are ever tracked, so plain dicts are used rather than a DataFrame.
+    """
 
     def __init__(self):
-        self.df = pd.DataFrame(columns=[self.SYMBOL_COLUMN, self.NEXT_SO_COLUMN, self.QUOTE_ASSET_COLUMN])
-        self.df = self.df.set_index([self.SYMBOL_COLUMN])
+        self.next_orders: Dict[str, Dict[str, float]] = {}
 
     def upsert(self, symbol, next_so, quote_asset):
-        self.df.loc[symbol, [self.NEXT_SO_COLUMN, self.QUOTE_ASSET_COLUMN]] = [next_so, quote_asset]
+        self.next_orders.setdefault(quote_asset, {})[symbol] = next_so
 
-    def drop_by_quote_asset(self, quote_asset):
-        self.df = self.df[self.df.quote_asset != quote_asset]
+    def replace_by_quote_asset(self, quote_asset, next_orders: Iterable[Tuple[str, float]]):
+        """
+        Swaps in all next orders for the quote asset at once. Symbols no longer active are dropped
+        """
+        self.next_orders[quote_asset] = dict(next_orders)
 
     def sum_next_orders(self, quote_asset):
-        return self.df.loc[self.df.quote_asset == quote_asset, self.NEXT_SO_COLUMN].sum()
-
-    def max_next_orders(self, quote_asset):
-        return self.df.loc[self.df.quote_asset == quote_asset, self.NEXT_SO_COLUMN].max()
+        return sum(self.next_orders.get(quote_asset, {}).values())
+
+    def sum_and_max_next_orders(self, quote_asset) -> Tuple[float, float]:
+        orders_sum = orders_max = 0.0
+        for next_so in self.next_orders.get(quote_asset, {}).values():
+            orders_sum += next_so
+            orders_max = max(orders_max, next_so)
+        return orders_sum, orders_max
@@ -1,8 +1,11 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(frozen=True)
 class BalanceUpdate:
+    # One is mapped for every balance event, so use slots rather than a per-instance __dict__
+    __slots__ = ("asset", "balance_delta", "event_time", "clear_time")
+
     asset: str
     balance_delta: float
     event_time: int
@@ -1,4 +1,8 @@
 import logging
+from operator import attrgetter
+from typing import Set
+
+from cachetools import TTLCache, cachedmethod
 
 from balance_update import BalanceUpdate
 from binance_client import BinanceClient
@@ -6,20 +10,33 @@ from savings_evaluation import SavingsEvaluation
 
 
 class BalanceUpdateProcessor:
+
+    # Seconds to reuse the active quote assets between balance updates. Open orders only change through order
+    # events, which invalidate the cache, so this is just a safety net in case an event is missed
+    ACTIVE_QUOTE_ASSETS_TTL = 5 * 60
+
     def __init__(
         self,
-        order_id_regex: str,
         binance_client: BinanceClient,
         savings_evaluation: SavingsEvaluation,
     ):
-        self.order_id_regex = order_id_regex
         self.binance_client = binance_client
         self.savings_evaluation = savings_evaluation
+        self.active_quote_assets_cache = TTLCache(maxsize=1, ttl=self.ACTIVE_QUOTE_ASSETS_TTL)
 
     def process_balance_update(self, balance_update: BalanceUpdate):
-        active_symbols = self.binance_client.get_symbols_by_client_order_id(self.order_id_regex)
-        quote_assets = {self.binance_client.get_quote_asset_from_symbol(sym) for sym in active_symbols}
-        if balance_update.asset in quote_assets:
+        if balance_update.asset in self.__get_active_quote_assets():
             self.savings_evaluation.send_savings_summary_msg(balance_update.asset)
         else:
             logging.info(f"Dropping Balance Update Event {balance_update}. Asset not active in DCA bot")
+
+    def invalidate_active_quote_assets(self):
+        """
+        Open orders have changed so the active quote assets must be fetched again on the next balance update
+        """
+        self.active_quote_assets_cache.clear()
+
+    @cachedmethod(attrgetter("active_quote_assets_cache"))
+    def __get_active_quote_assets(self) -> Set[str]:
+        active_symbols = self.binance_client.get_symbols_by_client_order_id()
+        return {self.binance_client.get_quote_asset_from_symbol_suffix(sym) for sym in active_symbols}
@@ -1,71 +1,161 @@
 import logging
 import re
-from typing import List
+from threading import RLock
+from typing import Dict, FrozenSet, Iterable, List, Tuple
 
 from binance.client import Client
 from cachetools import TTLCache, cached
+from cachetools.keys import hashkey
 
 from order import Order
+from resilient_call import RATE_LIMIT_STATUSES, resilient_call
 
 
 class BinanceClient:
-    def __init__(self, api_key, secret_key):
+
+    # Quote assets which can be read straight from the end of a symbol. None is a suffix of another listed or real
+    # quote asset, so order doesn't matter. Keep it that way when adding entries, e.g. USD can't be added (FDUSD, TUSD)
+    KNOWN_QUOTE_ASSETS = ("FDUSD", "USDT", "BUSD", "USDC", "TUSD", "BTC", "ETH", "BNB", "TRX", "DAI")
+
+    __symbol_info_cache = TTLCache(maxsize=100, ttl=7 * 24 * 60 * 60)
+    __symbol_step_size_cache = TTLCache(maxsize=100, ttl=24 * 60 * 60)
+    __symbol_info_lock = RLock()
+    __savings_product_lock = RLock()
+
+    def __init__(self, api_key, secret_key, order_id_regex: str):
         self.client = Client(api_key, secret_key)
+        # Compile once up front as this pattern is matched against every open order
+        self.order_id_pattern = re.compile(order_id_regex)
 
     # ---------------------------------------------------------------------------- #
     #                            Exchange Info Endpoints                           #
     # ---------------------------------------------------------------------------- #
 
     def get_base_asset_from_symbol(self, symbol) -> str:
-        logging.debug(f"Attempting to fetch {symbol} base asset from cache")
+        logging.debug("Attempting to fetch %s base asset from cache", symbol)
         return str(self.__get_symbol_info(symbol)["baseAsset"])
 
     def get_quote_asset_from_symbol(self, symbol) -> str:
-        logging.debug(f"Attempting to fetch {symbol} quote asset from cache")
+        logging.debug("Attempting to fetch %s quote asset from cache", symbol)
         return str(self.__get_symbol_info(symbol)["quoteAsset"])
 
+    def get_base_and_quote_assets_from_symbol(self, symbol) -> Tuple[str, str]:
+        symbol_info = self.__get_symbol_info(symbol)
+        return str(symbol_info["baseAsset"]), str(symbol_info["quoteAsset"])
+
+    def get_quote_asset_from_symbol_suffix(self, symbol) -> str:
+        """
+        Reads the quote asset from the end of the symbol for well known quote assets, avoiding the symbol info lookup.
+        Falls back to symbol info for any other quote asset.
+        """
+        for quote_asset in self.KNOWN_QUOTE_ASSETS:
+            if symbol.endswith(quote_asset) and len(symbol) > len(quote_asset):
+                return quote_asset
+        return self.get_quote_asset_from_symbol(symbol)
+
     def get_quote_precision(self, symbol) -> int:
         return int(self.__get_symbol_info(symbol)["quotePrecision"])
 
-    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60))
-    def get_cached_symbol_price(self, symbol) -> float:
-        return float(self.client.get_avg_price(symbol=symbol)["price"])
-
-    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60))
+    @cached(cache=__symbol_step_size_cache, lock=__symbol_info_lock)
+    @resilient_call()
     def get_symbol_step_size(self, symbol):
         """Don't fetch from cached symbol info as step size is something that changes occasionally"""
-        return self.client.get_symbol_info(symbol=symbol)["filters"][2]["stepSize"]
-
-    @cached(cache=TTLCache(maxsize=100, ttl=7 * 24 * 60 * 60))
+        return self.__get_lot_step_size(self.client.get_symbol_info(symbol=symbol))
+
+    def get_symbol_infos(self, symbols: Iterable[str]) -> Dict[str, dict]:
+        """
+        Fetches symbol info for many symbols at once. When more than one symbol is missing from the symbol info or
+        step size caches, they are all loaded from a single exchange info request rather than one request per symbol.
+        """
+        unique_symbols = list(dict.fromkeys(symbols))
+        with self.__symbol_info_lock:
+            missing_symbols = [
+                sym
+                for sym in unique_symbols
+                if hashkey(self, sym) not in self.__symbol_info_cache
+                or hashkey(self, sym) not in self.__symbol_step_size_cache
+            ]
+        if len(missing_symbols) > 1:
+            self.__bulk_load_symbol_info(missing_symbols)
+        return {sym: self.__get_symbol_info(sym) for sym in unique_symbols}
+
+    def preload_active_symbol_infos(self):
+        """
+        Warms the symbol info and step size caches for every symbol with open orders, so the first order event or
+        rebalance for those symbols does not wait on exchange info requests
+        """
+        try:
+            self.get_symbol_infos(self.get_symbols_by_client_order_id())
+        except Exception:
+            logging.exception("Unable to preload symbol info. It will be fetched on demand instead")
+
+    @resilient_call()
+    def __bulk_load_symbol_info(self, symbols: List[str]):
+        logging.debug("Bulk loading symbol info for %s from exchange info", symbols)
+        requested_symbols = set(symbols)
+        exchange_symbols = self.client.get_exchange_info()["symbols"]
+        with self.__symbol_info_lock:
+            for symbol_info in exchange_symbols:
+                if symbol_info["symbol"] in requested_symbols:
+                    key = hashkey(self, symbol_info["symbol"])
+                    self.__symbol_info_cache[key] = symbol_info
+                    # Exchange info is fresh so also refresh the step size
+                    self.__symbol_step_size_cache[key] = self.__get_lot_step_size(symbol_info)
+
+    def __get_lot_step_size(self, symbol_info):
+        return next(f["stepSize"] for f in symbol_info["filters"] if f["filterType"] == "LOT_SIZE")
+
+    @cached(cache=__symbol_info_cache, lock=__symbol_info_lock)
+    @resilient_call()
     def __get_symbol_info(self, symbol):
-        logging.debug(f"No cache entry for {symbol}. Fetching from Binance")
+        logging.debug("No cache entry for %s. Fetching from Binance", symbol)
         return self.client.get_symbol_info(symbol)
 
     # ---------------------------------------------------------------------------- #
     #                                Order Endpoints                               #
     # ---------------------------------------------------------------------------- #
 
-    def get_symbols_by_client_order_id(self, order_id_regex: str) -> List:
-        open_orders = [self.__map_order(ord) for ord in self.client.get_open_orders()]
-        return [ord.symbol for ord in open_orders if re.match(order_id_regex, ord.order_id)]
-
-    def get_all_orders_by_symbol(self, symbol) -> List[Order]:
-        return [self.__map_order(ord) for ord in self.client.get_all_orders(symbol=symbol)]
+    @resilient_call()
+    def get_symbols_by_client_order_id(self) -> List:
+        # Only the symbol is needed so filter the raw orders rather than mapping every open order first
+        match_order_id = self.order_id_pattern.match
+        return [ord["symbol"] for ord in self.client.get_open_orders() if match_order_id(ord["clientOrderId"])]
+
+    def get_latest_deal_orders_by_symbol(
+        self, symbol, statuses: FrozenSet[str] = None, sides: FrozenSet[str] = None
+    ) -> List[Order]:
+        """
+        Order history can be long, so the raw orders are filtered by status and side and only the orders
+        belonging to the most recent deal are mapped. Orders without a deal ID, e.g. manual orders, are ignored
+        """
+        deal_orders = []
+        for ord in self.__get_all_orders(symbol):
+            if (statuses is None or ord["status"] in statuses) and (sides is None or ord["side"] in sides):
+                deal_id = Order.parse_deal_id(ord["clientOrderId"])
+                if deal_id is not None:
+                    deal_orders.append((deal_id, ord))
+        if not deal_orders:
+            return []
+        latest_deal_id, _ = max(deal_orders, key=lambda deal_order: deal_order[1]["time"])
+        return [self.__map_order(ord) for deal_id, ord in deal_orders if deal_id == latest_deal_id]
+
+    @resilient_call()
+    def __get_all_orders(self, symbol):
+        return self.client.get_all_orders(symbol=symbol)
 
     def __map_order(self, order) -> Order:
         symbol = order["symbol"]
-        base_asset = self.get_base_asset_from_symbol(symbol)
-        quote_asset = self.get_quote_asset_from_symbol(symbol)
+        symbol_info = self.__get_symbol_info(symbol)
         return Order(
-            symbol,
-            base_asset,
-            quote_asset,
-            float(order["price"]),
-            float(order["origQty"]),
-            order["clientOrderId"],
-            order["status"],
-            order["side"],
-            order["time"],
+            symbol=symbol,
+            base_asset=str(symbol_info["baseAsset"]),
+            quote_asset=str(symbol_info["quoteAsset"]),
+            price=float(order["price"]),
+            quantity=float(order["origQty"]),
+            order_id=order["clientOrderId"],
+            status=order["status"],
+            side=order["side"],
+            timestamp=order["time"],
         )
 
     # ---------------------------------------------------------------------------- #
@@ -75,10 +165,15 @@ class BinanceClient:
     def get_available_asset_balance(self, asset) -> float:
         return float(self.__get_asset_balance(asset)["free"])
 
-    def get_total_asset_balance(self, asset) -> float:
+    def get_asset_balances(self, asset) -> Tuple[float, float]:
+        """
+        Returns the available and total spot balance for the asset from a single request
+        """
         asset_balance = self.__get_asset_balance(asset)
-        return float(asset_balance["free"]) + float(asset_balance["locked"])
+        available = float(asset_balance["free"])
+        return available, available + float(asset_balance["locked"])
 
+    @resilient_call()
     def __get_asset_balance(self, asset):
         return self.client.get_asset_balance(asset=asset)
 
@@ -91,20 +186,20 @@ class BinanceClient:
     def get_available_savings_by_asset(self, asset) -> float:
         asset_savings = self.__get_savings_position_by_asset(asset)
         if asset_savings is not None:
-            return float(self.__get_savings_position_by_asset(asset)["freeAmount"])
+            return float(asset_savings["freeAmount"])
         return 0
 
-    def get_accruing_interest_savings_by_asset(self, asset) -> float:
-        free_amt = self.get_available_savings_by_asset(asset)
-        today_amt = self.__get_today_purchased_amount_by_asset(asset)
-        return max(free_amt - today_amt, 0)
-
-    def __get_today_purchased_amount_by_asset(self, asset) -> float:
+    def get_savings_balances(self, asset) -> Tuple[float, float]:
+        """
+        Returns the available savings and the amount of it accruing interest for the asset from a single request
+        """
         asset_savings = self.__get_savings_position_by_asset(asset)
         if asset_savings is not None:
-            return float(self.__get_savings_position_by_asset(asset)["todayPurchasedAmount"])
-        return 0
+            available = float(asset_savings["freeAmount"])
+            return available, max(available - float(asset_savings["todayPurchasedAmount"]), 0)
+        return 0, 0
 
+    @resilient_call()
     def __get_savings_position_by_asset(self, asset):
         lending_position = self.client.get_lending_position(asset=asset)
         if lending_position is not None and len(lending_position) > 0:
@@ -113,7 +208,7 @@ class BinanceClient:
 
     # ------------------------- Savings product endpoints ------------------------ #
 
-    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60))
+    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60), lock=__savings_product_lock)
     def get_product_id(self, asset) -> str:
         savings_product = self.__get_savings_product_by_asset(asset)
         if savings_product is None:
@@ -136,7 +231,7 @@ class BinanceClient:
             and savings_product["status"] == "PURCHASING"
         )
 
-    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60))
+    @cached(cache=TTLCache(maxsize=100, ttl=24 * 60 * 60), lock=__savings_product_lock)
     def get_savings_min_purchase_amount_by_asset(self, asset) -> float:
         savings_product = self.__get_savings_product_by_asset(asset)
         if savings_product is not None:
@@ -144,25 +239,43 @@ class BinanceClient:
         else:
             return 0.0
 
-    @cached(cache=TTLCache(maxsize=100, ttl=5))
     def __get_savings_product_by_asset(self, asset):
+        # Hold the lock across the fetch so concurrent callers wait for one paged fetch rather than each making their own
+        with self.__savings_product_lock:
+            savings_products = self.__get_all_savings_products()
+        savings_product = savings_products.get(asset)
+        if savings_product is None:
+            logging.warn(f"Couldn't get lending product for asset {asset} from lending product list")
+        return savings_product
+
+    @cached(cache=TTLCache(maxsize=1, ttl=60), lock=__savings_product_lock)
+    @resilient_call()
+    def __get_all_savings_products(self) -> Dict[str, dict]:
+        """
+        Pages through the full lending product list once and indexes it by asset, so lookups for
+        different assets share the same requests. Short TTL as purchase/redeem availability changes daily.
+        """
         page_size, page_count = 100, 1
+        savings_products = {}
         while True:
             product_list = self.client.get_lending_product_list(size=page_size, current=page_count)
-            asset_product = [x for x in product_list if x["asset"] == asset]
-            if len(asset_product) > 0:
-                return asset_product[0]
-            elif len(product_list) < page_size:
-                logging.warn(f"Couldn't get lending product for asset {asset} from lending product list")
-                return None
+            savings_products.update({product["asset"]: product for product in product_list})
+            if len(product_list) < page_size:
+                return savings_products
             page_count = page_count + 1
 
     # ----------------------- Savings rebalancing endpoints ---------------------- #
 
     def subscribe_to_savings(self, asset, quantity):
-        product_id = self.get_product_id(asset)
-        return self.client.purchase_lending_product(productId=product_id, amount=quantity)
+        return self.__purchase_lending_product(self.get_product_id(asset), quantity)
 
     def redeem_from_savings(self, asset, quantity):
-        product_id = self.get_product_id(asset)
+        return self.__redeem_lending_product(self.get_product_id(asset), quantity)
+
+    @resilient_call(retry_statuses=RATE_LIMIT_STATUSES, retry_network_errors=False)
+    def __purchase_lending_product(self, product_id, quantity):
+        return self.client.purchase_lending_product(productId=product_id, amount=quantity)
+
+    @resilient_call(retry_statuses=RATE_LIMIT_STATUSES, retry_network_errors=False)
+    def __redeem_lending_product(self, product_id, quantity):
         return self.client.redeem_lending_product(productId=product_id, amount=quantity, type="FAST")
@@ -9,8 +9,18 @@ Start bot using /start. This triggers a reevaluation of current savings and star
 
 import logging
 import os
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
 
+import pytz
 import yaml
+from apscheduler.schedulers.background import BackgroundScheduler
+
+try:
+    # Prefer the libyaml backed parser where available
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 from asset_precision_calculator import AssetPrecisionCalculator
 from assets_dataframe import AssetsDataframe
@@ -24,35 +34,46 @@ from telegram_handler import TelegramHandler
 from telegram_notifier import TelegramNotifier
 from websocket_stream_reader import WebsocketStreamReader
 
-# Enable logging
-logging.basicConfig(
-    level=logging.INFO,
-    filename=os.path.basename(__file__) + ".log",
-    format="{asctime} [{levelname}] {threadName} | {module}.{funcName}:{lineno} :: {message}",
-    style="{",
-)
+LOG_FILE_MAX_BYTES = 10 * 1024 * 1024
+LOG_FILE_BACKUP_COUNT = 5
+
 
-# Load config from .config.yml file
+def configure_logging():
+    """
+    Logs to a size capped file so a long running bot does not grow its log without bound
+    """
+    log_handler = RotatingFileHandler(
+        os.path.basename(__file__) + ".log", maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT
+    )
+    logging.basicConfig(
+        level=logging.INFO,
+        handlers=[log_handler],
+        format="%(asctime)s [%(levelname)s] %(threadName)s | %(module)s.%(funcName)s:%(lineno)d :: %(message)s",
+    )
+
+
+# Load config from .config.yml file. Cached so the file is only read and parsed once
+@lru_cache(maxsize=1)
 def load_conf_file(config_file):
     with open(config_file, "r") as f:
-        config = yaml.safe_load(f)
+        config = yaml.load(f, Loader=SafeLoader)
         telegram_config = config["telegram"]
         binance_config = config["binance"]
         dca_bot_config = config["dca_bot"]
     return telegram_config, binance_config, dca_bot_config
 
 
-telegram_config, binance_config, dca_bot_config = load_conf_file(".config.yml")
-
-
 def main():
+    configure_logging()
+    telegram_config, binance_config, dca_bot_config = load_conf_file(".config.yml")
     telegram_notifier = TelegramNotifier(telegram_config["chat_id"], telegram_config["verbose"])
 
-    binance_client = BinanceClient(binance_config["api_key"], binance_config["secret_key"])
+    binance_client = BinanceClient(
+        binance_config["api_key"], binance_config["secret_key"], dca_bot_config["order_id_regex"]
+    )
     assets_dataframe = AssetsDataframe()
     asset_precision_calculator = AssetPrecisionCalculator(binance_client)
     savings_evaluation = SavingsEvaluation(
-        dca_bot_config["order_id_regex"],
         binance_client,
         telegram_notifier,
         dca_bot_config["dca_volume_scale"],
@@ -65,9 +86,17 @@ def main():
 
     FailureHandler(binance_client, savings_evaluation, telegram_notifier)
 
+    # Single scheduler thread shared by the rebalance job and the websocket health check
+    scheduler = BackgroundScheduler(timezone=pytz.utc)
+    scheduler.start()
+
+    # Load exchange info for active symbols up front and again daily as the step size cache expires
+    binance_client.preload_active_symbol_infos()
+    scheduler.add_job(binance_client.preload_active_symbol_infos, "interval", hours=24)
+
     schedule_hour, schedule_min = dca_bot_config["rebalance_time"]["hour"], dca_bot_config["rebalance_time"]["minute"]
     rebalance_savings_scheduler = RebalanceSavingsScheduler(
-        savings_evaluation, telegram_notifier, schedule_hour, schedule_min
+        savings_evaluation, telegram_notifier, scheduler, schedule_hour, schedule_min
     )
     telegram_handler = TelegramHandler(
         telegram_config["api_key"],
@@ -75,10 +104,13 @@ def main():
         savings_evaluation,
         rebalance_savings_scheduler,
         dca_bot_config["dry_run"],
+        telegram_config.get("webhook_url"),
+        telegram_config.get("webhook_listen"),
+        telegram_config.get("webhook_port"),
+        telegram_config.get("webhook_cert"),
+        telegram_config.get("webhook_key"),
     )
-    balance_update_processor = BalanceUpdateProcessor(
-        dca_bot_config["order_id_regex"], binance_client, savings_evaluation
-    )
+    balance_update_processor = BalanceUpdateProcessor(binance_client, savings_evaluation)
     order_processor = OrderUpdateProcessor(
         dca_bot_config["order_id_regex"], binance_client, savings_evaluation, telegram_notifier
     )
@@ -88,12 +120,16 @@ def main():
         balance_update_processor,
         order_processor,
         binance_client,
+        scheduler,
     )
     websocket_stream_reader.start_order_stream()
 
     # Blocking call. Signals only work in main thread so this must final call from main
     telegram_handler.run_telegram_bot()
 
+    # Telegram bot has stopped on SIGINT/SIGTERM/SIGABRT so close the websocket connection too
+    websocket_stream_reader.stop_order_stream()
+
 
 if __name__ == "__main__":
     main()
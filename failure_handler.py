@@ -1,3 +1,4 @@
+import datetime as dt
 import logging
 from binance_client import BinanceClient
 from savings_evaluation import SavingsEvaluation
@@ -20,12 +21,15 @@ class FailureHandler:
     It works as follows:
 
      - Assets which failed to rebalance are added to the rebalance_failures set.
-     - Handler will constantly monitor that set for presence of failed assets.
-     - If there failures present, we wait until Binance indicates the assets are available for purchasing and redemption again before re-attempting.
+     - Handler sleeps until a failure is added to the set.
+     - While there are failures present, we wait until Binance indicates the assets are available for purchasing and redemption again before re-attempting.
+     - Binance is not queried at all during the known closed window around 00:00 UTC.
      - Once assets are able to be purchased and redeemed again, the failure handler will clear down the existing failures and attempt to rebalance all savings assets.
     """
 
     ONE_MINUTE = 60
+    SAVINGS_WINDOW_OPEN = dt.time(0, 10)
+    SAVINGS_WINDOW_CLOSE = dt.time(23, 50)
 
     def __init__(
         self, binance_client: BinanceClient, savings_evaluation: SavingsEvaluation, telegram_notifier: TelegramNotifier
@@ -38,24 +42,54 @@ class FailureHandler:
 
     def monitor_failures(self):
         logging.info("Start failure monitoring")
+        failure_event = self.savings_evaluation.rebalance_failure_event
         while True:
-            can_rebalance = False
-            for failed_asset in self.savings_evaluation.rebalance_failures:
-                # All assets must be available for purchasing and redemption before we attempt to rebalance
-                can_purchase = self.binance_client.can_purchase_savings_asset(failed_asset)
-                can_redeem = self.binance_client.can_redeem_savings_asset(failed_asset)
-                if can_purchase and can_redeem:
-                    logging.info(f"Failed asset {failed_asset} is now available for purchasing and redemption again")
-                    can_rebalance = True
-                else:
-                    logging.warn(
-                        f"Failed asset {failed_asset} is still not available for purchasing and redemption. Will continue to monitor..."
-                    )
-                    can_rebalance = False
-                    break
-            if can_rebalance:
-                logging.info("Clearing failures and attempting to rebalance all symbols")
-                self.telegram_notifier.enqueue_message("Starting retry...", is_verbose=True)
-                self.savings_evaluation.rebalance_failures = set()
-                self.savings_evaluation.rebalance_all_symbols()
+            # Clear before checking for failures so a failure added after the check still wakes us up
+            failure_event.clear()
+            failed_assets = self.savings_evaluation.get_rebalance_failures()
+            if len(failed_assets) == 0:
+                failure_event.wait()
+                continue
+            if self.__is_savings_window_closed():
+                wait_seconds = self.__seconds_until_savings_window_opens()
+                logging.info(f"Binance Flexible Savings window is closed. Retrying failures in {wait_seconds:.0f}s")
+                sleep(wait_seconds)
+                continue
+            try:
+                self.__retry_failures(failed_assets)
+            except Exception:
+                # Binance may still be failing (eg. circuit open). Keep monitoring rather than losing the retries
+                logging.exception("Error occurred when retrying rebalance failures. Will try again")
             sleep(self.ONE_MINUTE)
+
+    def __retry_failures(self, failed_assets):
+        can_rebalance = False
+        for failed_asset in failed_assets:
+            # All assets must be available for purchasing and redemption before we attempt to rebalance
+            can_purchase = self.binance_client.can_purchase_savings_asset(failed_asset)
+            can_redeem = self.binance_client.can_redeem_savings_asset(failed_asset)
+            if can_purchase and can_redeem:
+                logging.info(f"Failed asset {failed_asset} is now available for purchasing and redemption again")
+                can_rebalance = True
+            else:
+                logging.warn(
+                    f"Failed asset {failed_asset} is still not available for purchasing and redemption. Will continue to monitor..."
+                )
+                can_rebalance = False
+                break
+        if can_rebalance:
+            logging.info("Clearing failures and attempting to rebalance all symbols")
+            self.telegram_notifier.enqueue_message("Starting retry...", is_verbose=True)
+            self.savings_evaluation.clear_rebalance_failures(failed_assets)
+            self.savings_evaluation.rebalance_all_symbols()
+
+    def __is_savings_window_closed(self):
+        now = dt.datetime.now(tz=dt.timezone.utc).time()
+        return now < self.SAVINGS_WINDOW_OPEN or now >= self.SAVINGS_WINDOW_CLOSE
+
+    def __seconds_until_savings_window_opens(self):
+        now = dt.datetime.now(tz=dt.timezone.utc)
+        window_open = dt.datetime.combine(now.date(), self.SAVINGS_WINDOW_OPEN, tzinfo=dt.timezone.utc)
+        if window_open <= now:
+            window_open += dt.timedelta(days=1)
+        return (window_open - now).total_seconds()
@@ -1,8 +1,12 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from typing import Optional
 
 
-@dataclass
+@dataclass(frozen=True)
 class Order:
+    # Many orders are mapped on every fetch, so use slots rather than a per-instance __dict__
+    __slots__ = ("symbol", "base_asset", "quote_asset", "price", "quantity", "order_id", "status", "side", "timestamp")
+
     symbol: str
     base_asset: str
     quote_asset: str
@@ -12,13 +16,21 @@ class Order:
     status: str
     side: str
     timestamp: int
-    quote_qty: float = field(init=False)
 
-    def __post_init__(self):
-        self.quote_qty = float(self.price) * float(self.quantity)
+    @property
+    def quote_qty(self) -> float:
+        return self.price * self.quantity
+
+    def get_deal_id(self) -> Optional[str]:
+        return Order.parse_deal_id(self.order_id)
 
-    def get_deal_id(self) -> str:
-        return self.order_id.split("_")[-2]
+    @staticmethod
+    def parse_deal_id(client_order_id: str) -> Optional[str]:
+        """
+        Deal ID is the second last "_" separated part of a 3Commas client order ID. None for other order IDs
+        """
+        parts = client_order_id.rsplit("_", 2)
+        return parts[-2] if len(parts) > 1 else None
 
     def is_new_order(self) -> bool:
         return self.status == "NEW"
@@ -27,7 +39,7 @@ class Order:
         return self.status == "FILLED"
 
     def is_new_or_filled_order(self) -> bool:
-        return self.status in ["NEW", "FILLED"]
+        return self.status in ("NEW", "FILLED")
 
     def is_buy_order(self) -> bool:
         return self.side == "BUY"
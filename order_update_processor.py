@@ -15,14 +15,15 @@ class OrderUpdateProcessor:
         savings_evaluation: SavingsEvaluation,
         telegram_notifier: TelegramNotifier,
     ):
-        self.order_id_regex = order_id_regex
+        # Compile once up front as this pattern is matched against every order event
+        self.order_id_pattern = re.compile(order_id_regex)
         self.binance_client = binance_client
         self.savings_evaluation = savings_evaluation
         self.telegram_notifier = telegram_notifier
 
     def process_order(self, order: Order):
         # Only proceed if client order ID matches format for DCA bot
-        if re.match(self.order_id_regex, order.order_id):
+        if self.order_id_pattern.match(order.order_id):
             self.__handle_buy_order(order) if order.is_buy_order() else self.__handle_sell_order(order)
         else:
             self.__log_order_event("Non-3Commas order received:\n\n", order, verbose=True)
@@ -50,9 +51,7 @@ class OrderUpdateProcessor:
     #                             Messaging and logging                            #
     # ---------------------------------------------------------------------------- #
     def __log_order_event(self, prepend, ord: Order, verbose: bool = False):
-        price = str(ord.price) + " " + ord.quote_asset
-        total = str(ord.quote_qty) + " " + ord.quote_asset
-        log = f"{prepend}\tSymbol: {ord.symbol} \n\tSide: {ord.side} \n\tQuantity: {ord.quantity} \n\tPrice: {price} \n\tTotal: {total} \n\tStatus: {ord.status}\n\tOrder ID: {ord.order_id}"
-        logging.info(log)
-        msg = f"{prepend}Symbol: {ord.symbol} \nSide: {ord.side} \nQuantity: {ord.quantity} \nPrice: {price} \nTotal: {total} \nStatus: {ord.status}\nOrder ID: {ord.order_id}"
-        self.telegram_notifier.enqueue_message(msg, verbose)
+        body = f"Symbol: {ord.symbol} \nSide: {ord.side} \nQuantity: {ord.quantity} \nPrice: {ord.price} {ord.quote_asset} \nTotal: {ord.quote_qty} {ord.quote_asset} \nStatus: {ord.status}\nOrder ID: {ord.order_id}"
+        # Log the same body indented under the prepended label
+        logging.info(prepend + "\t" + body.replace("\n", "\n\t"))
+        self.telegram_notifier.enqueue_message(prepend + body, verbose)
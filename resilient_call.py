@@ -0,0 +1,92 @@
+import logging
+import random
+from collections import deque
+from functools import wraps
+from threading import Lock
+from time import monotonic, sleep
+
+from binance.exceptions import BinanceAPIException
+from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+
+RATE_LIMIT_STATUSES = (418, 429)
+SERVER_ERROR_STATUSES = (500, 502, 503, 504)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops calls to Binance for a cool off period once too many transient failures happen in a short window.
+
+    This avoids hammering Binance with retries while it is rate limiting us or is otherwise unavailable.
+    """
+
+    def __init__(self, failure_threshold: int = 5, window: float = 30, cool_off: float = 30):
+        self.failure_threshold = failure_threshold
+        self.window = window
+        self.cool_off = cool_off
+        self.failure_times = deque()
+        self.open_until = 0.0
+        self.lock = Lock()
+
+    def check(self):
+        if monotonic() < self.open_until:
+            raise CircuitOpenError("Too many recent failures calling Binance. Not attempting call until cool off ends")
+
+    def record_failure(self):
+        now = monotonic()
+        with self.lock:
+            self.failure_times.append(now)
+            while self.failure_times[0] < now - self.window:
+                self.failure_times.popleft()
+            if len(self.failure_times) >= self.failure_threshold:
+                logging.warn(f"{len(self.failure_times)} Binance failures in {self.window}s. Opening circuit")
+                self.open_until = now + self.cool_off
+                self.failure_times.clear()
+
+
+binance_circuit_breaker = CircuitBreaker()
+
+
+def resilient_call(
+    max_attempts: int = 3,
+    base_wait: float = 0.5,
+    max_wait: float = 8,
+    retry_statuses=RATE_LIMIT_STATUSES + SERVER_ERROR_STATUSES,
+    retry_network_errors: bool = True,
+):
+    """
+    Retries a Binance REST call with exponential backoff when it fails with one of the retry statuses, or when
+    the connection to Binance fails or times out.
+
+    Calls which change state (eg. savings purchases) should only retry on rate limit statuses, as Binance
+    rejects those requests outright whereas a server error or dropped connection may still have been actioned.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                binance_circuit_breaker.check()
+                try:
+                    return func(*args, **kwargs)
+                except BinanceAPIException as ex:
+                    if ex.status_code not in retry_statuses:
+                        raise
+                    error, reason = ex, f"status {ex.status_code} (code {ex.code})"
+                except (RequestsConnectionError, Timeout) as ex:
+                    if not retry_network_errors:
+                        raise
+                    error, reason = ex, f"{type(ex).__name__}: {ex}"
+                binance_circuit_breaker.record_failure()
+                if attempt == max_attempts - 1:
+                    raise error
+                wait = min(base_wait * 2**attempt, max_wait) + random.random() * 0.1
+                logging.warn(f"{func.__name__} failed with {reason}. Retrying in {wait:.2f}s")
+                sleep(wait)
+
+        return wrapper
+
+    return decorator
@@ -1,6 +1,9 @@
 import logging
+import re
 import threading
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
+from typing import Dict, Iterable, List, Set, Tuple
 
 from asset_precision_calculator import AssetPrecisionCalculator
 from assets_dataframe import AssetsDataframe
@@ -18,13 +21,21 @@ class SavingsEvaluation:
         - User executes Telegram command
         - Rebalancing failure handler executing retries
 
-    In order to avoid race conditions during rebalancing calculations, we must treat this code as synchronous.
-    We use a Semaphore here to achieve this.
+    In order to avoid race conditions during rebalancing calculations, we must treat this code as synchronous
+    for each quote asset. We use a lock per quote asset here to achieve this, so rebalancing one quote asset
+    does not hold up events for symbols paired with another.
     """
 
+    # Orders which make up a DCA deal: the filled base order and any filled or open safety orders
+    DEAL_ORDER_STATUSES = frozenset({"NEW", "FILLED"})
+    DEAL_ORDER_SIDES = frozenset({"BUY"})
+    # Upper bound on symbols whose orders are fetched from Binance at the same time while rebalancing
+    MAX_CONCURRENT_ORDER_FETCHES = 8
+    # Upper bound on quote assets rebalanced at the same time. Each holds only its own quote asset lock
+    MAX_CONCURRENT_QUOTE_ASSETS = 4
+
     def __init__(
         self,
-        order_id_regex: str,
         binance_client: BinanceClient,
         telegram_notifier: TelegramNotifier,
         dca_volume_scale: float,
@@ -34,7 +45,6 @@ class SavingsEvaluation:
         excluded_symbols: List[str],
         dry_run: bool = False,
     ):
-        self.order_id_regex = order_id_regex
         self.binance_client = binance_client
         self.telegram_notifier = telegram_notifier
         self.dca_volume_scale = dca_volume_scale
@@ -42,38 +52,64 @@ class SavingsEvaluation:
         self.assets_dataframe = assets_dataframe
         self.asset_precision_calculator = asset_precision_calculator
         self.excluded_symbols = excluded_symbols
+        # Symbols are excluded if they contain any of the configured values, so match them all with one pattern
+        self.excluded_symbols_pattern = (
+            re.compile("|".join(map(re.escape, excluded_symbols))) if excluded_symbols else None
+        )
         self.dry_run = dry_run
         self.rebalance_failures = set()
-        self.rebalance_mutex = threading.Semaphore(1)
+        self.rebalance_failures_lock = threading.Lock()
+        # Set whenever a failure is added so the failure handler only wakes up when there is work to do
+        self.rebalance_failure_event = threading.Event()
+        # Reentrant as reevaluating a symbol holds its quote asset lock while rebalancing that quote asset
+        self.quote_asset_locks: Dict[str, threading.RLock] = {}
+        self.quote_asset_locks_guard = threading.Lock()
+        # Single worker so summaries are still sent in the order they were requested
+        self.summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="SavingsSummary")
 
     def reevaluate_symbol(self, symbol: str, order_event: Order = None):
         try:
-            self.rebalance_mutex.acquire()
-            self.__reevaluate_symbol(symbol, order_event)
+            quote_asset = self.binance_client.get_quote_asset_from_symbol_suffix(symbol)
+            with self.__get_quote_asset_lock(quote_asset):
+                self.__reevaluate_symbol(symbol, order_event)
         except Exception as ex:
             msg = f"Unexpected error occurred while rebalancing for {symbol}. Will not retry. See logs for more details. Exception: {ex}"
             self.telegram_notifier.enqueue_message(msg)
             logging.exception(msg)
-        finally:
-            self.rebalance_mutex.release()
 
     def rebalance_all_symbols(self):
         try:
-            self.rebalance_mutex.acquire()
             self.__rebalance_quote_assets()
         except Exception as ex:
             msg = f"Unexpected error occurred while rebalancing all assets. Will not retry. See logs for more details. Exception: {ex}"
             self.telegram_notifier.enqueue_message(msg)
             logging.exception(msg)
-        finally:
-            self.rebalance_mutex.release()
 
-    def send_savings_summary_msg(self, asset, is_rebalanced=True):
+    def __get_quote_asset_lock(self, quote_asset: str) -> threading.RLock:
+        with self.quote_asset_locks_guard:
+            return self.quote_asset_locks.setdefault(quote_asset, threading.RLock())
+
+    def send_savings_summary_msg(self, asset, is_rebalanced=True, spot_balances: Tuple[float, float] = None):
+        """
+        The summary only reports balances, so it is built in the background rather than holding up order events
+        or the quote asset lock while the balances are fetched.
+        Spot balances already fetched earlier in the same pass can be passed in to avoid fetching them again
+        """
+        self.summary_executor.submit(self.__send_savings_summary_msg, asset, is_rebalanced, spot_balances)
+
+    def __send_savings_summary_msg(self, asset, is_rebalanced, spot_balances: Tuple[float, float]):
+        try:
+            self.__build_and_send_savings_summary_msg(asset, is_rebalanced, spot_balances)
+        except Exception:
+            logging.exception(f"Error occurred when sending savings summary for {asset}")
+
+    def __build_and_send_savings_summary_msg(self, asset, is_rebalanced, spot_balances: Tuple[float, float]):
         precision = self.asset_precision_calculator.get_asset_precision(asset)
-        available_spot = f"%.{precision}f" % self.binance_client.get_available_asset_balance(asset)
-        total_spot = f"%.{precision}f" % self.binance_client.get_total_asset_balance(asset)
-        available_savings = f"%.{precision}f" % self.binance_client.get_available_savings_by_asset(asset)
-        accruing_interest = f"%.{precision}f" % self.binance_client.get_accruing_interest_savings_by_asset(asset)
+        if spot_balances is None:
+            spot_balances = self.binance_client.get_asset_balances(asset)
+        savings_balances = self.binance_client.get_savings_balances(asset)
+        available_spot, total_spot = ("%.*f" % (precision, balance) for balance in spot_balances)
+        available_savings, accruing_interest = ("%.*f" % (precision, balance) for balance in savings_balances)
         prepend_msg = (
             f"{asset} savings rebalanced." if is_rebalanced == True else f"{asset} savings did not need rebalanced."
         )
@@ -93,13 +129,15 @@ class SavingsEvaluation:
         if self.__is_safety_order_open(current_deal_orders):
             self.telegram_notifier.enqueue_message(f"Reevaluating spot balance for {symbol}")
             next_so_val = self.__calculate_next_order_value(symbol, current_deal_orders)
-            quote_asset = self.binance_client.get_quote_asset_from_symbol(symbol)
+            quote_asset = self.binance_client.get_quote_asset_from_symbol_suffix(symbol)
             self.assets_dataframe.upsert(symbol, next_so_val, quote_asset)
-            if self.__is_rebalance_required(quote_asset):
-                self.__rebalance_quote_assets([quote_asset])
+            # Fetched once and reused by whichever branch below runs
+            spot_balances = self.binance_client.get_asset_balances(quote_asset)
+            available_spot_balance = spot_balances[0]
+            if self.__is_rebalance_required(quote_asset, available_spot_balance):
+                self.__rebalance_quote_assets([quote_asset], {quote_asset: available_spot_balance})
             else:
-                quote_asset = self.binance_client.get_quote_asset_from_symbol(symbol)
-                self.send_savings_summary_msg(quote_asset, is_rebalanced=False)
+                self.send_savings_summary_msg(quote_asset, is_rebalanced=False, spot_balances=spot_balances)
         else:
             msg = f"Evaluated current deal orders but safety order is not yet open for {symbol}"
             logging.warn(msg)
@@ -112,7 +150,8 @@ class SavingsEvaluation:
         we pass the "order event" order and only append it to the list if it wasn't returned in the
         call to Binance fetch all orders.
         """
-        if order.get_deal_id() == orders[0].get_deal_id() and order.order_id not in [ord.order_id for ord in orders]:
+        is_same_deal = order.get_deal_id() == orders[0].get_deal_id()
+        if is_same_deal and not any(ord.order_id == order.order_id for ord in orders):
             logging.info(
                 f"Order {order.order_id} was not in list of orders. Appending order event to list. Order: {order}"
             )
@@ -121,64 +160,106 @@ class SavingsEvaluation:
         return orders
 
     def __log_orders(self, orders: List[Order], label: str):
-        logging.info(f"\n- -{label}: START ORDER LOGGING- -")
-        for order in orders:
-            logging.info(order)
-        logging.info(f"- -{label}: END ORDER LOGGING- -\n")
+        """
+        Order dumps are only useful when debugging, so they are logged as a single debug record
+        """
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("%s:\n\t%s", label, "\n\t".join(map(str, orders)))
 
     def __is_safety_order_open(self, current_deal_orders: List[Order]):
         """
         Ensures we have at least one Base Order (FILLED) and one open Safety Order (NEW)
         """
-        statuses = [ord.status for ord in current_deal_orders]
-        return "FILLED" in statuses and "NEW" in statuses
-
-    def __is_rebalance_required(self, quote_asset: str):
-        orders_sum = self.assets_dataframe.sum_next_orders(quote_asset)
-        orders_max = self.assets_dataframe.max_next_orders(quote_asset)
+        has_new_order = has_filled_order = False
+        for ord in current_deal_orders:
+            has_new_order = has_new_order or ord.is_new_order()
+            has_filled_order = has_filled_order or ord.is_filled_order()
+            if has_new_order and has_filled_order:
+                return True
+        return False
+
+    def __is_rebalance_required(self, quote_asset: str, current_spot_balance: float):
+        orders_sum, orders_max = self.assets_dataframe.sum_and_max_next_orders(quote_asset)
         min_balance_required = max(orders_sum * self.quote_coverage, orders_max)
-        current_spot_balance = self.binance_client.get_available_asset_balance(quote_asset)
         return current_spot_balance < min_balance_required
 
     # ---------------------------------------------------------------------------- #
     #                 Rebalance savings for one or all quote assets                #
     # ---------------------------------------------------------------------------- #
 
-    def __rebalance_quote_assets(self, quote_asset=None):
-        active_symbols = self.binance_client.get_symbols_by_client_order_id(self.order_id_regex)
+    def __rebalance_quote_assets(
+        self, requested_quote_assets: Iterable[str] = None, known_spot_balances: Dict[str, float] = None
+    ):
+        """
+        Rebalances the requested quote assets, or every active quote asset if none are requested.
+        Spot balances fetched earlier in the same pass can be passed in as known_spot_balances to avoid refetching
+        """
+        if isinstance(requested_quote_assets, str):
+            # A bare string would otherwise be treated as a collection of single character quote assets
+            requested_quote_assets = [requested_quote_assets]
+        known_spot_balances = known_spot_balances or {}
+        active_symbols = self.binance_client.get_symbols_by_client_order_id()
         # When all safety orders are filled we do not want to count next orders in calculations, so we filter them out
-        filtered_active_symbols = [x for x in active_symbols if all(y not in x for y in self.excluded_symbols)]
-        quote_assets = self.__get_quote_assets(filtered_active_symbols) if quote_asset is None else set(quote_asset)
+        filtered_active_symbols = [x for x in active_symbols if not self.__is_excluded_symbol(x)]
+        symbols_by_quote_asset = self.__group_symbols_by_quote_asset(filtered_active_symbols)
+        quote_assets = set(symbols_by_quote_asset if requested_quote_assets is None else requested_quote_assets)
         self.telegram_notifier.enqueue_message("Reevaluating quote assets: {0}".format(", ".join(quote_assets)))
-        for quote_asset in quote_assets:
-            self.assets_dataframe.drop_by_quote_asset(quote_asset)
-            quote_symbols = self.__filter_symbols_by_quote_asset(filtered_active_symbols, quote_asset)
-            quote_precision = int(self.binance_client.get_quote_precision(quote_symbols[0]))
-            for quote_symbol in quote_symbols:
-                deal_orders = self.__get_current_deal_orders_by_symbol(quote_symbol)
-                next_so = self.__calculate_next_order_value(quote_symbol, deal_orders)
-                self.assets_dataframe.upsert(quote_symbol, next_so, quote_asset)
+        quote_symbols = [symbols_by_quote_asset.get(quote_asset, []) for quote_asset in quote_assets]
+        quote_balances = [known_spot_balances.get(quote_asset) for quote_asset in quote_assets]
+        if len(quote_assets) == 1:
+            # Must stay on this thread: reevaluating a symbol already holds this quote asset's lock
+            self.__rebalance_quote_asset_with_lock(next(iter(quote_assets)), quote_symbols[0], quote_balances[0])
+            return
+        # Quote assets are independent of each other, so a slow one does not need to hold up the rest
+        max_workers = max(min(self.MAX_CONCURRENT_QUOTE_ASSETS, len(quote_assets)), 1)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="QuoteRebalance") as executor:
+            list(executor.map(self.__rebalance_quote_asset_with_lock, quote_assets, quote_symbols, quote_balances))
+
+    def __rebalance_quote_asset_with_lock(
+        self, quote_asset: str, quote_symbols: List[str], current_quote_balance: float = None
+    ):
+        with self.__get_quote_asset_lock(quote_asset):
+            self.__rebalance_quote_asset(quote_asset, quote_symbols, current_quote_balance)
+
+    def __rebalance_quote_asset(self, quote_asset: str, quote_symbols: List[str], current_quote_balance: float = None):
+        quote_precision = int(self.binance_client.get_quote_precision(quote_symbols[0]))
+        # Each symbol needs its own order history request, so fetch them concurrently
+        max_workers = max(min(self.MAX_CONCURRENT_ORDER_FETCHES, len(quote_symbols)), 1)
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="OrderFetch") as executor:
+            next_sos = list(executor.map(self.__calculate_symbol_next_order_value, quote_symbols))
+        # Replaced only once every symbol is calculated, so a failed fetch leaves the previous values in place
+        self.assets_dataframe.replace_by_quote_asset(quote_asset, zip(quote_symbols, next_sos))
+        if current_quote_balance is None:
             current_quote_balance = self.binance_client.get_available_asset_balance(quote_asset)
-            required_quote_balance = self.assets_dataframe.sum_next_orders(quote_asset)
-            self.__rebalance_savings(quote_asset, quote_precision, current_quote_balance, required_quote_balance)
+        required_quote_balance = self.assets_dataframe.sum_next_orders(quote_asset)
+        self.__rebalance_savings(quote_asset, quote_precision, current_quote_balance, required_quote_balance)
+
+    def __is_excluded_symbol(self, symbol: str) -> bool:
+        return self.excluded_symbols_pattern is not None and self.excluded_symbols_pattern.search(symbol) is not None
 
-    def __get_quote_assets(self, active_symbols):
-        return {self.binance_client.get_quote_asset_from_symbol(sym) for sym in active_symbols}
+    def __group_symbols_by_quote_asset(self, active_symbols) -> Dict[str, List[str]]:
+        """
+        Groups symbols by their actual quote asset from symbol info. Each symbol appears once even if it
+        has several open orders.
+        """
+        symbols_by_quote_asset = {}
+        for symbol, symbol_info in self.binance_client.get_symbol_infos(active_symbols).items():
+            symbols_by_quote_asset.setdefault(str(symbol_info["quoteAsset"]), []).append(symbol)
+        return symbols_by_quote_asset
 
-    def __filter_symbols_by_quote_asset(self, symbols, quote_asset):
-        return [sym for sym in symbols if str(sym).endswith(quote_asset)]
+    def __calculate_symbol_next_order_value(self, symbol: str) -> float:
+        deal_orders = self.__get_current_deal_orders_by_symbol(symbol)
+        return self.__calculate_next_order_value(symbol, deal_orders)
 
     def __get_current_deal_orders_by_symbol(self, symbol: str) -> List[Order]:
-        orders = self.binance_client.get_all_orders_by_symbol(symbol)
-        filtered_orders = [ord for ord in orders if (ord.is_new_or_filled_order() and ord.is_buy_order())]
-        sorted_filtered_orders = self.__sort_orders_by_timestamp(filtered_orders)
-        # Extract the 3Commas deal ID from the client order ID
-        deal_id = sorted_filtered_orders[0].get_deal_id()
-        # Get all orders associated with the most recent deal
-        return [ord for ord in sorted_filtered_orders if deal_id in ord.order_id]
+        # Only orders associated with the most recent 3Commas deal are returned, so only these few need sorting
+        deal_orders = self.binance_client.get_latest_deal_orders_by_symbol(
+            symbol, self.DEAL_ORDER_STATUSES, self.DEAL_ORDER_SIDES
+        )
+        return self.__sort_orders_by_timestamp(deal_orders)
 
     def __sort_orders_by_timestamp(self, orders: List[Order]) -> List[Order]:
-        return sorted(orders, key=lambda x: x.timestamp, reverse=True)
+        return sorted(orders, key=attrgetter("timestamp"), reverse=True)
 
     def __calculate_next_order_value(self, symbol: str, current_deal_orders: List[Order]) -> float:
         """
@@ -186,30 +267,28 @@ class SavingsEvaluation:
         For example, if during reevaluation of a symbol another symbol also hits TP meaning its existing orders are cancelled.
         If this happens we will just use the current order size in current_deal_orders, or failing that return 0.0 for next order size.
         """
-        open_so: Order = None
-        try:
-            open_so = [ord for ord in current_deal_orders if ord.is_new_order()][0]
-        except IndexError as err:
+        open_so: Order = next((ord for ord in current_deal_orders if ord.is_new_order()), None)
+        if open_so is None:
             msg = f"Error occurred fetching orders for {symbol}. Most likely the symbol has hit take profit during this reevaluation. Correct calculation should happen on subsequent evaluation. See logs for more details."
             self.telegram_notifier.enqueue_message(msg)
             if len(current_deal_orders) > 0:
                 open_so = current_deal_orders[0]
                 logging.warn(
-                    f"NEW order not available for {symbol}. Using order {open_so} to calculate next safety order instead. Error: {err}"
+                    f"NEW order not available for {symbol}. Using order {open_so} to calculate next safety order instead"
                 )
             else:
                 logging.error(
-                    f"Unable to fetch any open orders for symbol {symbol}. Skipping safety order calculation and returning 0.0. Error: {err}"
+                    f"Unable to fetch any open orders for symbol {symbol}. Skipping safety order calculation and returning 0.0"
                 )
                 return 0.0
         step_size = self.binance_client.get_symbol_step_size(symbol)
         next_so_cost = self.__calculate_next_so_cost(open_so, step_size)
-        logging.info(f"Next safety order cost: {next_so_cost}")
+        logging.info(f"Next safety order cost for {symbol}: {next_so_cost}")
         return next_so_cost
 
     def __calculate_next_so_cost(self, open_so: Order, step_size: float):
-        step_size_buffer = float(open_so.price) * float(step_size)
-        return float(open_so.quote_qty) * self.dca_volume_scale + step_size_buffer
+        step_size_buffer = open_so.price * float(step_size)
+        return open_so.quote_qty * self.dca_volume_scale + step_size_buffer
 
     # ---------------------------------------------------------------------------- #
     #                           Preform rebalance savings                          #
@@ -223,7 +302,7 @@ class SavingsEvaluation:
         elif rebalance_amount > 0:
             self.__subscribe_asset_to_savings(quote_asset, rebalance_amount)
         else:
-            msg = "No rebalancing required"
+            msg = f"No rebalancing required for {quote_asset}"
             logging.info(msg)
             self.telegram_notifier.enqueue_message(msg)
 
@@ -233,12 +312,12 @@ class SavingsEvaluation:
         """
         logging.info(f"Redeeming {quantity} {asset} to Spot Wallet")
         precision = self.asset_precision_calculator.get_asset_precision(asset)
-        rounded_qty = f"%.{precision}f" % quantity
+        rounded_qty = "%.*f" % (precision, quantity)
 
         # Notify user if we do not have enough in Flexible Savings to fund Spot Wallet requirements. In this case we will proceed to redeem all funds remaining
         savings_amount = self.binance_client.get_available_savings_by_asset(asset)
         if savings_amount < quantity:
-            rounded_savings = f"%.{precision}f" % savings_amount
+            rounded_savings = "%.*f" % (precision, savings_amount)
             msg = f"Not enough enough {asset} funds to cover upcoming Safety Orders. Moving all Flexible Savings to Spot Wallet. Required amount: {rounded_qty} {asset} Flexible Savings: {rounded_savings} {asset}"
             logging.warn(msg)
             self.telegram_notifier.enqueue_message(msg)
@@ -249,7 +328,7 @@ class SavingsEvaluation:
             msg = f"{asset} is currently unavailable to redeem from Flexible Savings. Will retry when it becomes available"
             logging.warn(msg)
             self.telegram_notifier.enqueue_message(msg)
-            self.rebalance_failures.add(asset)
+            self.__add_rebalance_failure(asset)
             return
 
         # Execute redemption from Flexible Savings
@@ -257,7 +336,7 @@ class SavingsEvaluation:
             if self.dry_run == False and quantity > 0:
                 self.binance_client.redeem_from_savings(asset, quantity)
             else:
-                msg = f"Running in dry-run mode. Will not move any funds"
+                msg = f"Running in dry-run mode. Will not move any {asset} funds"
                 logging.info(msg)
                 self.telegram_notifier.enqueue_message(msg)
 
@@ -271,7 +350,7 @@ class SavingsEvaluation:
             self.telegram_notifier.enqueue_message(
                 f"Error occurred when rebalancing asset {asset}. Will retry. See logs for details"
             )
-            self.rebalance_failures.add(asset)
+            self.__add_rebalance_failure(asset)
 
     def __subscribe_asset_to_savings(self, asset, quantity):
         """
@@ -279,7 +358,7 @@ class SavingsEvaluation:
         """
         logging.info(f"Subscribing {quantity} {asset} to Flexible Savings")
         precision = self.asset_precision_calculator.get_asset_precision(asset)
-        rounded_qty = f"%.{precision}f" % quantity
+        rounded_qty = "%.*f" % (precision, quantity)
 
         # Ensure we are not attempting to subscribe less than the minimum allowed amount
         min_purchase_amount = self.binance_client.get_savings_min_purchase_amount_by_asset(asset)
@@ -294,7 +373,7 @@ class SavingsEvaluation:
             msg = f"{asset} is currently unavailable to purchase in Flexible Savings. Will retry when it becomes available"
             logging.warn(msg)
             self.telegram_notifier.enqueue_message(msg)
-            self.rebalance_failures.add(asset)
+            self.__add_rebalance_failure(asset)
             return
 
         # Execute subscription to Flexible Savings
@@ -302,7 +381,7 @@ class SavingsEvaluation:
             if self.dry_run == False:
                 self.binance_client.subscribe_to_savings(asset, quantity)
             else:
-                msg = f"Running in dry-run mode. Will not move any funds"
+                msg = f"Running in dry-run mode. Will not move any {asset} funds"
                 logging.info(msg)
                 self.telegram_notifier.enqueue_message(msg)
             msg = f"Moved {rounded_qty} {asset} from Spot Wallet to Flexible Savings"
@@ -315,4 +394,23 @@ class SavingsEvaluation:
             self.telegram_notifier.enqueue_message(
                 f"Error occurred when rebalancing asset {asset}. Will attempt to retry. See logs for details"
             )
+            self.__add_rebalance_failure(asset)
+
+    def get_rebalance_failures(self) -> Set[str]:
+        """
+        Returns a snapshot of the failed assets, safe to iterate while other threads add failures
+        """
+        with self.rebalance_failures_lock:
+            return set(self.rebalance_failures)
+
+    def clear_rebalance_failures(self, assets: Iterable[str]):
+        """
+        Only clears the given assets, so failures added since they were read are kept for the next retry
+        """
+        with self.rebalance_failures_lock:
+            self.rebalance_failures.difference_update(assets)
+
+    def __add_rebalance_failure(self, asset):
+        with self.rebalance_failures_lock:
             self.rebalance_failures.add(asset)
+        self.rebalance_failure_event.set()
@@ -6,6 +6,11 @@ from telegram_notifier import TelegramNotifier
 
 
 class TelegramHandler:
+
+    # Only listen locally by default, expecting a TLS terminating proxy in front unless a certificate is configured
+    DEFAULT_WEBHOOK_LISTEN = "127.0.0.1"
+    DEFAULT_WEBHOOK_PORT = 8443
+
     def __init__(
         self,
         api_key,
@@ -13,13 +18,24 @@ class TelegramHandler:
         savings_evaluation: SavingsEvaluation,
         rebalance_savings_scheduler: RebalanceSavingsScheduler,
         dry_run: bool = False,
+        webhook_url: str = None,
+        webhook_listen: str = None,
+        webhook_port: int = None,
+        webhook_cert: str = None,
+        webhook_key: str = None,
     ):
         self.telegram_notifier = telegram_notifier
         self.savings_evaluation = savings_evaluation
         self.rebalance_savings_scheduler = rebalance_savings_scheduler
         self.dry_run = dry_run
-        self.start_telegram_bot(api_key)
+        self.webhook_url = webhook_url
+        self.webhook_listen = webhook_listen or self.DEFAULT_WEBHOOK_LISTEN
+        self.webhook_port = webhook_port or self.DEFAULT_WEBHOOK_PORT
+        self.webhook_cert = webhook_cert
+        self.webhook_key = webhook_key
+        # Must be set before polling starts, as a command may be handled before __init__ returns
         self.bot_started = False
+        self.start_telegram_bot(api_key)
 
     def start_telegram_bot(self, api_key):
         # """Initialise Telegram bot."""
@@ -29,15 +45,34 @@ class TelegramHandler:
             request_kwargs={"connect_timeout": 10, "read_timeout": 20},
         )
 
-        # Add command handlers
+        # Add command handlers. Commands which call Binance run async so they don't block the dispatcher from
+        # handling other updates. /start stays sequential as it must only start the bot once
         dp = self.updater.dispatcher
-        dp.add_handler(CommandHandler("start", self.__start))  # /start
-        dp.add_handler(CommandHandler("rebalance", self.__rebalance))  # /rebalance
-        dp.add_handler(CommandHandler("scheduler", self.__scheduler))  # /scheduler
-        dp.add_handler(CommandHandler("test", self.__test))  # /test
+        command_handlers = (
+            ("start", self.__start, False),
+            ("rebalance", self.__rebalance, True),
+            ("scheduler", self.__scheduler, True),
+            ("test", self.__test, True),
+        )
+        for command, callback, run_async in command_handlers:
+            dp.add_handler(CommandHandler(command, callback, run_async=run_async))
 
         # Start the Telegram Bot
-        self.updater.start_polling()
+        if self.webhook_url:
+            # Telegram pushes updates to the webhook, so there are no getUpdates requests at all. Telegram only pushes
+            # to HTTPS, so either serve TLS directly with webhook_cert/webhook_key or sit behind a TLS terminating
+            # proxy. The API key in the path stops anyone else posting updates
+            self.updater.start_webhook(
+                listen=self.webhook_listen,
+                port=self.webhook_port,
+                url_path=api_key,
+                cert=self.webhook_cert,
+                key=self.webhook_key,
+                webhook_url=f"{self.webhook_url.rstrip('/')}/{api_key}",
+            )
+        else:
+            # Long poll for up to 20s per request so an idle bot makes few getUpdates calls
+            self.updater.start_polling(timeout=20)
 
     def run_telegram_bot(self):
         """
@@ -73,8 +108,7 @@ class TelegramHandler:
 
     def __scheduler(self, update, context):
         if self.bot_started:
-            next_run_info = self.rebalance_savings_scheduler.send_scheduler_summary()
-            self.telegram_notifier.enqueue_message(next_run_info)
+            self.rebalance_savings_scheduler.send_scheduler_summary()
         else:
             logging.warn("Bot is not started. Execute /start command from Telegram")
 
@@ -1,8 +1,9 @@
+import html
 import logging
 
 from collections import deque
-from threading import Thread
-from time import sleep
+from threading import Event, Thread
+from time import monotonic, sleep
 from telegram.error import RetryAfter
 
 
@@ -16,13 +17,28 @@ class TelegramNotifier:
     We are using a combination of queues and with exception handling to address these requirements.
 
     https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this
+
+    Messages which queue up between sends are combined into a single Telegram message where they fit.
     """
 
+    MAX_MESSAGE_LENGTH = 4096
+    MESSAGE_SEPARATOR = "\n\n"
+    # Caps memory if Telegram is unreachable or the notifier is never started. Oldest messages are dropped first
+    MAX_QUEUED_MESSAGES = 1000
+    # Seconds between sends to stay within one message per second to the group
+    SEND_INTERVAL = 1
+    # No more than GROUP_MESSAGE_LIMIT messages to the group in any GROUP_MESSAGE_WINDOW seconds
+    GROUP_MESSAGE_LIMIT = 20
+    GROUP_MESSAGE_WINDOW = 60
+
     def __init__(self, chat_id: str, verbose: bool = False):
         self.chat_id = chat_id
         self.verbose = verbose
         self.context = None
-        self.message_queue = deque()
+        self.message_queue = deque(maxlen=self.MAX_QUEUED_MESSAGES)
+        # Set whenever a message is enqueued so the worker only wakes up when there is something to send
+        self.message_available = Event()
+        self.send_times = deque(maxlen=self.GROUP_MESSAGE_LIMIT)
 
     def start_notifier(self, context):
         """
@@ -34,47 +50,88 @@ class TelegramNotifier:
 
     def enqueue_message(self, message: str, is_verbose: bool = False):
         """
-        Enqueues a message to be picked by the worker thread and sent to Telegram group
+        Enqueues a message to be picked by the worker thread and sent to Telegram group. Never blocks the caller.
+
+        Verbose messages are dropped here when not in verbose mode so they never take up space in the queue.
+
+        Messages are sent as HTML and batched together, so text is escaped here. Otherwise a single message with stray
+        markup (eg. an HTML error page embedded in a Binance exception) would get the whole batch rejected by Telegram.
         """
-        self.message_queue.append((message, is_verbose))
+        if is_verbose and not self.verbose:
+            return
+        if len(self.message_queue) == self.MAX_QUEUED_MESSAGES:
+            logging.warn(f"Telegram message queue is full. Dropping oldest message to enqueue: {message}")
+        self.message_queue.append(html.escape(str(message), quote=False))
+        self.message_available.set()
 
     def __read_message_queue(self):
         """
-        Polls the queue for new messages to be sent to Telegram group.
+        Waits for new messages to be sent to Telegram group, then sends until the queue is empty.
 
-        Here we read from the queue at 1 second intervals.
+        Here we wait at least 1 second after each send before sending the next message.
 
         This achieves the first rate limiting constraint:
         "avoid sending more than one message per second"
         """
         while True:
-            if len(self.message_queue) > 0:
-                self.__send_message(self.message_queue.popleft())
-            sleep(1)
+            self.message_available.wait()
+            # Clear before draining so a message enqueued mid-drain still wakes us up again
+            self.message_available.clear()
+            while len(self.message_queue) > 0:
+                self.__send_message(self.__pop_message_batch())
+                sleep(self.SEND_INTERVAL)
 
-    def __send_message(self, queue_item: tuple):
+    def __pop_message_batch(self):
         """
-        Sends a message to Telegram group
+        Pops as many queued messages as fit in one Telegram message and joins them together.
+        Only called when the queue is not empty.
+        """
+        messages, batch_length = [], 0
+        while len(self.message_queue) > 0:
+            batch_length += len(self.message_queue[0]) + len(self.MESSAGE_SEPARATOR)
+            if len(messages) > 0 and batch_length > self.MAX_MESSAGE_LENGTH:
+                break
+            messages.append(self.message_queue.popleft())
+        return self.MESSAGE_SEPARATOR.join(messages)
 
-        Here we catch any RetryAfter exceptions and sleep the thread for the given duration.
-        Failed messages will placed on the front of the queue for retrying.
+    def __send_message(self, message: str):
+        """
+        Sends a message to Telegram group
 
+        Here we wait before sending if the last 20 messages were all sent within the last minute.
         This addresses the second rate limiting constraint:
         "your bot will not be able to send more than 20 messages per minute to the same group"
+
+        As a safety net we also catch any RetryAfter exceptions and sleep the thread for the given duration.
+        Failed messages will placed on the front of the queue for retrying.
         """
-        message = queue_item[0]
-        is_verbose = queue_item[1]
         if self.context is None or self.chat_id is None:
             logging.error(f"Telegram bot not yet started. Couldn't send message: {message}")
-        elif self.verbose == True or is_verbose == False:
+        else:
+            self.__wait_for_group_rate_limit()
             try:
+                self.send_times.append(monotonic())
                 self.context.bot.send_message(chat_id=self.chat_id, text=message, parse_mode="HTML")
             except RetryAfter as retry_ex:
                 retry_after = retry_ex.retry_after
                 logging.warn(f"Received rate limit error. Retrying after {retry_after} seconds.")
-                self.message_queue.appendleft(queue_item)
+                if len(self.message_queue) == self.MAX_QUEUED_MESSAGES:
+                    logging.warn(
+                        f"Telegram message queue is full. Dropping newest message to requeue failed message: {self.message_queue[-1]}"
+                    )
+                self.message_queue.appendleft(message)
                 sleep(retry_after)
             except Exception as telegram_ex:
                 logging.exception(
                     f"Unexpected exception sending message to Telegram. Will not retry sending message. Error: {telegram_ex}"
                 )
+
+    def __wait_for_group_rate_limit(self):
+        if len(self.send_times) < self.GROUP_MESSAGE_LIMIT:
+            return
+        wait_seconds = self.send_times[0] + self.GROUP_MESSAGE_WINDOW - monotonic()
+        if wait_seconds > 0:
+            logging.info(
+                f"Sent {self.GROUP_MESSAGE_LIMIT} Telegram messages in the last minute. Waiting {wait_seconds:.0f}s"
+            )
+            sleep(wait_seconds)
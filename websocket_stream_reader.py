@@ -1,7 +1,8 @@
 import logging
+from queue import Full, Queue
+from threading import Thread
 
-import pytz
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import BaseScheduler
 from binance import ThreadedWebsocketManager
 
 from balance_update import BalanceUpdate
@@ -12,6 +13,16 @@ from order_update_processor import OrderUpdateProcessor
 
 
 class WebsocketStreamReader:
+    """
+    Reads balance and order events from the Binance user data stream.
+
+    Processing an event can involve several Binance REST calls. To avoid holding up the websocket thread while
+    those calls are in flight, events are handed to a worker thread via a bounded queue and processed in the
+    order they were received.
+    """
+
+    EVENT_QUEUE_SIZE = 1024
+
     def __init__(
         self,
         api_key,
@@ -19,30 +30,52 @@ class WebsocketStreamReader:
         balance_update_processor: BalanceUpdateProcessor,
         order_processor: OrderUpdateProcessor,
         binance_client: BinanceClient,
+        scheduler: BaseScheduler,
     ):
         self.api_key = api_key
         self.secret_key = secret_key
         self.balance_update_processor = balance_update_processor
         self.order_processor = order_processor
         self.binance_client = binance_client
+        self.scheduler = scheduler
+        self.event_queue = Queue(maxsize=self.EVENT_QUEUE_SIZE)
+        self.event_handlers = {
+            "balanceUpdate": self.__handle_balance_update_event,
+            "executionReport": self.__handle_order_update_event,
+        }
 
     def start_order_stream(self):
         logging.info("Starting order stream reader")
+        event_worker = Thread(target=self.__process_event_queue, name="WebsocketEventWorkerThread", daemon=True)
+        event_worker.start()
         self.twm = ThreadedWebsocketManager(api_key=self.api_key, api_secret=self.secret_key)
         self.twm.start()
         self.twm.start_user_socket(callback=self.__handle_event)
         self.__do_health_check()
 
-        # Start health check scheduler
-        scheduler = BackgroundScheduler(timezone=pytz.utc)
-        scheduler.add_job(self.__do_health_check, "interval", minutes=10)
-        scheduler.start()
+        # Health check runs on the shared scheduler rather than starting another scheduler thread
+        self.scheduler.add_job(self.__do_health_check, "interval", minutes=10)
+
+    def stop_order_stream(self):
+        logging.info("Stopping order stream reader")
+        self.twm.stop()
 
     def __handle_event(self, event):
-        if event["e"] == "balanceUpdate":
-            self.__handle_balance_update_event(event)
-        elif event["e"] == "executionReport":
-            self.__handle_order_update_event(event)
+        """
+        Websocket callback. Only enqueues the event, dropping it if the worker has fallen a full queue behind rather
+        than blocking the websocket manager's event loop
+        """
+        event_handler = self.event_handlers.get(event["e"])
+        if event_handler is not None:
+            try:
+                self.event_queue.put_nowait((event_handler, event))
+            except Full:
+                logging.warn(f"Event queue full. Dropping {event['e']} event: {event}")
+
+    def __process_event_queue(self):
+        while True:
+            event_handler, event = self.event_queue.get()
+            event_handler(event)
 
     def __handle_balance_update_event(self, balance_event):
         try:
@@ -57,29 +90,36 @@ class WebsocketStreamReader:
         try:
             order = self.__map_order(order_event)
             logging.info(f"Order event received: {order}")
+            self.balance_update_processor.invalidate_active_quote_assets()
             self.order_processor.process_order(order)
         except Exception as ex:
             msg = f"Error occurred when attempting to process order update event. Exception: {ex}"
             logging.exception(msg)
 
     def __map_balance_update(self, balance_update: dict):
-        return BalanceUpdate(balance_update["a"], balance_update["d"], balance_update["E"], balance_update["T"])
+        return BalanceUpdate(
+            asset=balance_update["a"],
+            balance_delta=float(balance_update["d"]),
+            event_time=balance_update["E"],
+            clear_time=balance_update["T"],
+        )
 
     def __map_order(self, order: dict):
         symbol = order["s"]
-        base_asset = self.binance_client.get_base_asset_from_symbol(symbol)
-        quote_asset = self.binance_client.get_quote_asset_from_symbol(symbol)
+        base_asset, quote_asset = self.binance_client.get_base_and_quote_assets_from_symbol(symbol)
         return Order(
-            symbol,
-            base_asset,
-            quote_asset,
-            float(order["p"]),
-            float(order["q"]),
-            order["c"],
-            order["X"],
-            order["S"],
-            int(order["O"]),
+            symbol=symbol,
+            base_asset=base_asset,
+            quote_asset=quote_asset,
+            price=float(order["p"]),
+            quantity=float(order["q"]),
+            order_id=order["c"],
+            status=order["X"],
+            side=order["S"],
+            timestamp=int(order["O"]),
         )
 
     def __do_health_check(self):
-        logging.info(f"ThreadedWebsocketManager health check: {self.twm.is_alive()}")
+        logging.info(
+            f"ThreadedWebsocketManager health check: {self.twm.is_alive()}. Queued events: {self.event_queue.qsize()}"
+        )